@@ -4,11 +4,20 @@ import service.document_service as document_service
 import os
 import sys
 import subprocess
-from datetime import datetime
+import math
+from datetime import datetime, time
 
 
 st.set_page_config(layout="wide", page_icon="📄")
 
+DOCS_PAGE_SIZE = 20
+
+SORT_OPTIONS = {
+    "Nazwa": "name",
+    "Data modyfikacji": "mod_date",
+    "Kategoria": "category",
+}
+
 # =====================
 # Session state init
 # =====================
@@ -25,6 +34,19 @@ if "need_retrain" not in st.session_state:
 if "retrain_decision" not in st.session_state:
     st.session_state.retrain_decision = None
 
+# pliki już obsłużone w tej sesji (uploader zwraca plik przy każdym rerunie),
+# klucz: file_id uploadu
+if "indexed_uploads" not in st.session_state:
+    st.session_state.indexed_uploads = set()
+
+# uploady zakończone błędem: file_id -> komunikat (bez ponownego przetwarzania)
+if "failed_uploads" not in st.session_state:
+    st.session_state.failed_uploads = {}
+
+# bieżąca strona listy dokumentów (stan widgetu number_input)
+if "docs_page" not in st.session_state:
+    st.session_state.docs_page = 1
+
 # =====================
 # Cross-platform open
 # =====================
@@ -43,6 +65,16 @@ def open_doc(doc_name):
     else:
         subprocess.call(["xdg-open", path])
 
+# =====================
+# Model lifecycle
+# =====================
+
+def drop_model_service():
+    # zamknij procesy robocze shardów, zanim porzucimy serwis
+    if st.session_state.mod_service is not None:
+        st.session_state.mod_service.close()
+    st.session_state.mod_service = None
+
 # =====================
 # Retrain prompt (INLINE)
 # =====================
@@ -59,14 +91,14 @@ def retrain_prompt():
         if st.button("Tak"):
             st.session_state.retrain_decision = True
             st.session_state.need_retrain = False
-            st.session_state.mod_service = None
+            drop_model_service()
             st.rerun()
 
     with col2:
         if st.button("Nie"):
             st.session_state.retrain_decision = False
             st.session_state.need_retrain = False
-            st.session_state.mod_service = None
+            drop_model_service()
             st.rerun()
 
 # =====================
@@ -102,6 +134,10 @@ def init_model():
             )
         )
 
+def reset_docs_page():
+    # zmiana filtrów/sortowania wraca na pierwszą stronę
+    st.session_state.docs_page = 1
+
 def documents_view():
     st.divider()
     st.header("📄 Dokumenty")
@@ -111,51 +147,137 @@ def documents_view():
         type=["txt", "docx"]
     )
 
-    if uploaded:
-        path = os.path.join(
-            os.getcwd(),
-            document_service.DocumentService.DOCS_DIR_PATH,
-            uploaded.name
+    upload_key = uploaded.file_id if uploaded else None
+
+    if upload_key in st.session_state.failed_uploads:
+        st.error(st.session_state.failed_uploads[upload_key])
+    elif uploaded and upload_key not in st.session_state.indexed_uploads:
+        doc_service = st.session_state.doc_service
+        name = os.path.basename(uploaded.name)
+
+        try:
+            with st.spinner(f"Indeksowanie {name}..."):
+                doc_service.save_upload(name, uploaded)
+                doc_service.add_document(name)
+                st.session_state.mod_service.add_document(name)
+                # status dopiero po zaindeksowaniu w obu silnikach - inaczej
+                # nieudany upload nie byłby wykryty jako zmiana do przetrenowania
+                doc_service.mark_indexed(name)
+        except ValueError as e:
+            message = f"Nie udało się dodać pliku {name}: {e}"
+            st.session_state.failed_uploads[upload_key] = message
+            st.error(message)
+        except Exception as e:
+            message = (
+                f"Plik {name} zapisano, ale nie udało się go zaindeksować: {e}. "
+                "Zostanie uwzględniony przy ponownym trenowaniu."
+            )
+            st.session_state.failed_uploads[upload_key] = message
+            st.error(message)
+        else:
+            st.session_state.indexed_uploads.add(upload_key)
+            st.success(f"Plik {name} zapisany i dodany do wyszukiwarki")
+
+    docs = st.session_state.doc_service.documents
+
+    if not docs:
+        st.info("Brak dokumentów.")
+        return
+
+    # filtrowanie/sortowanie/stronicowanie po stronie DocumentStore -
+    # renderowana jest tylko bieżąca strona
+    f1, f2, f3, f4 = st.columns([2, 2, 2, 1])
+
+    with f1:
+        category = st.selectbox(
+            "Kategoria",
+            options=["Wszystkie", *sorted(docs.categories)],
+            key="docs_category",
+            on_change=reset_docs_page
         )
 
-        with open(path, "wb") as f:
-            f.write(uploaded.getbuffer())
+    with f2:
+        date_range = st.date_input(
+            "Data modyfikacji",
+            value=(),
+            key="docs_dates",
+            on_change=reset_docs_page
+        )
 
-        st.success(f"Plik {uploaded.name} zapisany")
+    with f3:
+        sort_label = st.selectbox(
+            "Sortuj według",
+            options=list(SORT_OPTIONS),
+            key="docs_sort",
+            on_change=reset_docs_page
+        )
 
-        st.session_state.retrain_decision = None
-        st.session_state.need_retrain = True
-        st.session_state.mod_service = None
+    with f4:
+        descending = st.toggle("Malejąco", key="docs_desc", on_change=reset_docs_page)
 
-        st.rerun()
+    date_from = date_to = None
+    if len(date_range) == 2:
+        date_from = datetime.combine(date_range[0], time.min).timestamp()
+        date_to = datetime.combine(date_range[1], time.max).timestamp()
 
-    docs = st.session_state.doc_service.documents
+    filters = dict(
+        category=None if category == "Wszystkie" else category,
+        date_from=date_from,
+        date_to=date_to,
+        sort_by=SORT_OPTIONS[sort_label],
+        descending=descending
+    )
 
-    if not docs:
-        st.info("Brak dokumentów.")
+    # jedno zapytanie zwraca i stronę, i liczbę wszystkich pasujących
+    page_ids, total = docs.query(
+        **filters,
+        offset=(st.session_state.docs_page - 1) * DOCS_PAGE_SIZE,
+        limit=DOCS_PAGE_SIZE
+    )
+    pages = max(1, math.ceil(total / DOCS_PAGE_SIZE))
+
+    # strona poza zakresem (np. po zmianie listy dokumentów) - ostatnia strona
+    if st.session_state.docs_page > pages:
+        st.session_state.docs_page = pages
+        page_ids, total = docs.query(
+            **filters,
+            offset=(pages - 1) * DOCS_PAGE_SIZE,
+            limit=DOCS_PAGE_SIZE
+        )
+
+    st.number_input(
+        f"Strona (z {pages}, dokumentów: {total})",
+        min_value=1,
+        max_value=pages,
+        key="docs_page"
+    )
+
+    if not page_ids:
+        st.info("Brak dokumentów spełniających kryteria.")
         return
 
-    for doc in docs:
+    for doc_id in page_ids:
+        name = docs.names[doc_id]
         col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
 
         with col1:
-            st.write(doc.name)
+            st.write(name)
 
         with col2:
-            st.info(doc.category)
+            st.info(docs.category(doc_id))
 
         with col3:
             st.write(
-                datetime.fromtimestamp(doc.mod_date)
+                datetime.fromtimestamp(docs.mod_date(doc_id))
                 .strftime("%Y-%m-%d %H:%M")
             )
 
         with col4:
             st.button(
                 "Otwórz",
-                key=f"{doc.name}_open",
+                key=f"{name}_open",
                 on_click=open_doc,
-                args=[doc.name]
+                args=[name]
             )
 
 
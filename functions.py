@@ -11,6 +11,7 @@ def get_updated_model_service(doc_service):
     # NAZWY MUSZĄ PASOWAĆ 1:1 do ModelService
     model_service.train_doc2vec()
     model_service.train_tfidf()
+    model_service.ensure_shards()
 
     return model_service
 
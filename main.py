@@ -10,6 +10,7 @@ def retrain_models(doc_service: DocumentService) -> ModelService:
     model_service = ModelService(documents)
     model_service.train_tfidf()
     model_service.train_doc2vec()
+    model_service.ensure_shards()
 
     return model_service
 
@@ -77,6 +78,7 @@ def main():
                     ).strip().lower()
 
                     if inp == "tak":
+                        model_service.close()
                         model_service = retrain_models(doc_service)
                     else:
                         print("Pominięto trenowanie.")
@@ -85,6 +87,7 @@ def main():
 
             case "4":
                 print("Koniec programu.")
+                model_service.close()
                 break
 
             case _:
@@ -1,4 +1,6 @@
 class Document:
+    __slots__ = ("name", "mod_date", "content", "category")
+
     def __init__(self, name, mod_date, content, category="Ogólne"):
         self.name = name
         self.mod_date = mod_date
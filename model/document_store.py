@@ -0,0 +1,282 @@
+import hashlib
+from array import array
+from model.document import Document
+
+
+class DocumentStore:
+    """
+    Kolumnowy magazyn dokumentów.
+
+    Zamiast listy obiektów Document trzyma:
+    - names - nazwy plików (id dokumentu = pozycja na liście)
+    - mtimes - czasy modyfikacji w nanosekundach (int64)
+    - category_codes - kody kategorii (uint16) w słowniku categories
+    - chunk_ids/offsets - fragment bufora tekstu i granice treści w nim
+
+    Treść jest dopisywana do bufora złożonego z fragmentów: dokumenty dodane
+    między odczytami trafiają do nowego fragmentu, więc dodanie dokumentu
+    nie kopiuje całego korpusu. Treść zastąpionych dokumentów jest odzyskiwana
+    przez kompaktowanie, gdy stanowi ponad połowę bufora.
+
+    Obiekty Document są tworzone na żądanie jako lekkie widoki.
+
+    Odcisk korpusu (fingerprint) to XOR skrótów (nazwa, treść) wszystkich
+    dokumentów - nie zależy od kolejności i jest aktualizowany przy każdym add()
+    bez przeglądania pozostałych dokumentów.
+    """
+
+    SORT_KEYS = ("name", "mod_date", "category")
+
+    # typ array("H") - kody kategorii 0..65535
+    MAX_CATEGORIES = 2 ** 16
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.mtimes = array("q")
+        self.category_codes = array("H")
+        self.categories: list[str] = []
+        self.hashes = array("Q")
+
+        self._ids: dict[str, int] = {}
+        self._category_ids: dict[str, int] = {}
+
+        # treść dokumentu i: _chunks[_chunk_ids[i]][_starts[i]:_ends[i]]
+        self._chunk_ids = array("l")
+        self._starts = array("q")
+        self._ends = array("q")
+        self._chunks: list[str] = []
+        # treści jeszcze niezłączone w kolejny fragment (indeks len(_chunks))
+        self._pending: list[str] = []
+        self._pending_size = 0
+        # łączna długość treści zastąpionych dokumentów w buforze
+        self._dead_size = 0
+        self._live_size = 0
+
+        # posortowane id dokumentów per klucz sortowania (czyszczone przy add)
+        self._sorted: dict[str, list[int]] = {}
+
+        self._fingerprint = 0
+
+    @classmethod
+    def from_documents(cls, documents) -> "DocumentStore":
+        store = cls()
+        for doc in documents:
+            store.add(doc.name, int(doc.mod_date * 1e9), doc.content, doc.category)
+        return store
+
+    # =========================
+    # Zapis
+    # =========================
+
+    def add(self, name: str, mtime_ns: int, content: str, category: str) -> int:
+        """
+        Dodaje dokument (lub nadpisuje istniejący o tej samej nazwie) i zwraca jego id.
+        """
+        code = self._category_code(category)
+        self._sorted.clear()
+
+        doc_hash = self.document_hash(name, content)
+        self._fingerprint ^= doc_hash
+
+        chunk_id = len(self._chunks)
+        start = self._pending_size
+        self._pending.append(content)
+        self._pending_size += len(content)
+        self._live_size += len(content)
+
+        doc_id = self._ids.get(name)
+        if doc_id is None:
+            doc_id = len(self.names)
+            self._ids[name] = doc_id
+            self.names.append(name)
+            self.mtimes.append(mtime_ns)
+            self.category_codes.append(code)
+            self.hashes.append(doc_hash)
+            self._chunk_ids.append(chunk_id)
+            self._starts.append(start)
+            self._ends.append(self._pending_size)
+        else:
+            # stara treść zostaje w buforze do kompaktowania, wiersz wskazuje na nową
+            old_size = self._ends[doc_id] - self._starts[doc_id]
+            self._dead_size += old_size
+            self._live_size -= old_size
+
+            self._fingerprint ^= self.hashes[doc_id]
+            self.hashes[doc_id] = doc_hash
+
+            self.mtimes[doc_id] = mtime_ns
+            self.category_codes[doc_id] = code
+            self._chunk_ids[doc_id] = chunk_id
+            self._starts[doc_id] = start
+            self._ends[doc_id] = self._pending_size
+
+            if self._dead_size > self._live_size:
+                self._compact()
+
+        return doc_id
+
+    @staticmethod
+    def document_hash(name: str, content: str) -> int:
+        h = hashlib.blake2b(digest_size=8)
+        h.update(name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(content.encode("utf-8"))
+        return int.from_bytes(h.digest(), "big")
+
+    # =========================
+    # Odczyt
+    # =========================
+
+    @property
+    def fingerprint(self) -> str:
+        return f"{self._fingerprint:016x}"
+
+    @staticmethod
+    def combine_fingerprints(*fingerprints: str | None) -> str | None:
+        """
+        XOR odcisków - np. odcisk indeksu ^ stary ^ nowy odcisk korpusu
+        przenosi na indeks zmiany w korpusie. Nieznany odcisk (None) daje None.
+        """
+        if any(fp is None for fp in fingerprints):
+            return None
+
+        result = 0
+        for fp in fingerprints:
+            result ^= int(fp, 16)
+        return f"{result:016x}"
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self):
+        for doc_id in range(len(self.names)):
+            yield self[doc_id]
+
+    def __getitem__(self, doc_id: int) -> Document:
+        return Document(
+            name=self.names[doc_id],
+            mod_date=self.mtimes[doc_id] / 1e9,
+            content=self.content(doc_id),
+            category=self.category(doc_id)
+        )
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def id_of(self, name: str) -> int | None:
+        return self._ids.get(name)
+
+    def get(self, name: str) -> Document | None:
+        doc_id = self._ids.get(name)
+        return None if doc_id is None else self[doc_id]
+
+    def content(self, doc_id: int) -> str:
+        chunk_id = self._chunk_ids[doc_id]
+        if chunk_id == len(self._chunks):
+            self._flush()
+        return self._chunks[chunk_id][self._starts[doc_id]:self._ends[doc_id]]
+
+    def category(self, doc_id: int) -> str:
+        return self.categories[self.category_codes[doc_id]]
+
+    def category_of(self, name: str) -> str | None:
+        doc_id = self._ids.get(name)
+        return None if doc_id is None else self.category(doc_id)
+
+    def mod_date(self, doc_id: int) -> float:
+        return self.mtimes[doc_id] / 1e9
+
+    def query(self, category: str | None = None, date_from: float | None = None,
+              date_to: float | None = None, sort_by: str = "name", descending: bool = False,
+              offset: int = 0, limit: int = 20) -> tuple[list[int], int]:
+        """
+        Filtrowanie, sortowanie i stronicowanie po kolumnach metadanych
+        (bez tworzenia obiektów Document i bez dotykania treści).
+        Daty w sekundach (timestamp). Zwraca (id dokumentów na stronie, liczba wszystkich pasujących).
+        """
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"Nieznany klucz sortowania: {sort_by}")
+
+        # posortowana kolejność jest w cache - malejąco czytamy ją od końca, bez kopii
+        order = self._sorted_ids(sort_by)
+
+        code = None
+        if category is not None:
+            code = self._category_ids.get(category)
+            if code is None:
+                return [], 0
+
+        min_ns = None if date_from is None else int(date_from * 1e9)
+        max_ns = None if date_to is None else int(date_to * 1e9)
+
+        if code is None and min_ns is None and max_ns is None:
+            total = len(order)
+            if not descending:
+                return order[offset:offset + limit], total
+
+            end = max(total - offset, 0)
+            return order[max(end - limit, 0):end][::-1], total
+
+        # jedno przejście: liczenie wszystkich pasujących, zapamiętanie tylko strony
+        codes, mtimes = self.category_codes, self.mtimes
+        page, total = [], 0
+        for doc_id in (reversed(order) if descending else order):
+            if ((code is None or codes[doc_id] == code)
+                    and (min_ns is None or mtimes[doc_id] >= min_ns)
+                    and (max_ns is None or mtimes[doc_id] <= max_ns)):
+                if offset <= total < offset + limit:
+                    page.append(doc_id)
+                total += 1
+
+        return page, total
+
+    def _sorted_ids(self, sort_by: str) -> list[int]:
+        if sort_by not in self._sorted:
+            if sort_by == "name":
+                key = self.names.__getitem__
+            elif sort_by == "mod_date":
+                key = self.mtimes.__getitem__
+            else:
+                key = lambda doc_id: (self.category(doc_id), self.names[doc_id])
+            self._sorted[sort_by] = sorted(range(len(self.names)), key=key)
+        return self._sorted[sort_by]
+
+    def _flush(self) -> None:
+        # złączenie oczekujących treści w jeden nowy fragment (tylko one są kopiowane)
+        if self._pending:
+            self._chunks.append("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _compact(self) -> None:
+        """
+        Przepisuje treść wszystkich dokumentów do jednego fragmentu,
+        zwalniając treść dokumentów zastąpionych.
+        """
+        contents = [self.content(doc_id) for doc_id in range(len(self.names))]
+
+        self._chunks = []
+        self._pending = []
+        self._pending_size = 0
+
+        position = 0
+        for doc_id, content in enumerate(contents):
+            self._chunk_ids[doc_id] = 0
+            self._starts[doc_id] = position
+            position += len(content)
+            self._ends[doc_id] = position
+
+        self._chunks.append("".join(contents))
+        self._dead_size = 0
+
+    def _category_code(self, category: str) -> int:
+        code = self._category_ids.get(category)
+        if code is None:
+            code = len(self.categories)
+            if code >= self.MAX_CATEGORIES:
+                raise ValueError(
+                    f"Przekroczono limit {self.MAX_CATEGORIES} kategorii: {category}"
+                )
+            self._category_ids[category] = code
+            self.categories.append(category)
+        return code
@@ -1,11 +1,15 @@
 import os
 import json
 import re
+import shutil
+import zipfile
 import nltk
+import xml.etree.ElementTree as ET
 from functools import lru_cache
 from nltk.corpus import stopwords
 from nltk.tokenize import RegexpTokenizer
-from model.document import Document
+from model.document_store import DocumentStore
+from service.file_lock import FileLock
 
 
 class DocumentService:
@@ -14,11 +18,21 @@ class DocumentService:
     - wczytanie dokumentów z katalogu
     - wstępny preprocessing tekstu
     - wykrywanie zmian w plikach
+    - dodawanie pojedynczych dokumentów (upload) bez ponownego wczytywania katalogu
+    - cache korpusu po preprocessingu (niezmienione pliki nie są ponownie przetwarzane)
     """
 
     DOCS_DIR_PATH = "documents"
     DOCS_STATUS_FILE = "data/docs_status.json"
-    FILE_EXTENSIONS = (".txt",)
+    # treść po preprocessingu + kategoria per plik, ważne dla tego samego (mtime, rozmiar)
+    CORPUS_CACHE_FILE = "data/corpus_cache.json"
+    # zmiana preprocessingu lub kategoryzacji wymaga podbicia wersji (unieważnia cache)
+    CORPUS_CACHE_VERSION = 1
+    FILE_EXTENSIONS = (".txt", ".docx")
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # przestrzeń nazw WordprocessingML (word/document.xml w pliku .docx)
+    _DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
 
     # regexy do czyszczenia szumu
     _RE_URL = re.compile(r"(https?://\S+|www\.\S+)", re.IGNORECASE)
@@ -28,7 +42,7 @@ class DocumentService:
     _RE_SPECIAL_CHARS = re.compile(r"[^a-zA-Z\s]")
 
     def __init__(self):
-        self.documents: list[Document] = []
+        self.documents = DocumentStore()
         # upewnij się, że NLTK ma potrzebne zasoby (raz na start serwisu)
         self._ensure_nltk_resources()
 
@@ -36,33 +50,113 @@ class DocumentService:
     # Publiczne API serwisu
     # =========================
 
-    def load_documents(self) -> list[Document]:
+    def load_documents(self, save_status: bool = True) -> DocumentStore:
         """
         Wczytuje dokumenty z katalogu documents/,
-        wykonuje preprocessing i zwraca listę Document.
+        wykonuje preprocessing i zwraca DocumentStore.
+
+        Pliki niezmienione od poprzedniego wczytania są brane z cache korpusu.
+        save_status=False nie zapisuje pliku statusu - wczytanie nie ukrywa
+        wtedy zmian przed has_changes() (np. strojenie w tune.py).
         """
-        self.documents = []
+        self.documents = DocumentStore()
 
         files = self._get_document_files()
+        cache = self._load_corpus_cache()
+        updated_cache = {}
 
         for file in files:
             path = os.path.join(self.DOCS_DIR_PATH, file)
-            content = self._read_file(path)
-            processed_content = self.preprocess_text(content)
-            category = self._detect_category(content)
-
-            self.documents.append(
-                Document(
-                    name=file,
-                    mod_date=os.path.getmtime(path),
-                    content=processed_content,
-                    category=category
-                )
+            stat = os.stat(path)
+
+            entry = cache.get(file)
+            if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                try:
+                    content = self._read_file(path)
+                except ValueError as e:
+                    # uszkodzony plik nie może blokować wczytania pozostałych
+                    print(f"Pominięto dokument {file}: {e}")
+                    continue
+
+                entry = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "content": self.preprocess_text(content),
+                    "category": self._detect_category(content),
+                }
+            updated_cache[file] = entry
+
+            self.documents.add(
+                name=file,
+                mtime_ns=stat.st_mtime_ns,
+                content=entry["content"],
+                category=entry["category"]
             )
 
-        self._save_files_status(files)
+        if updated_cache != cache:
+            self._save_corpus_cache(updated_cache)
+
+        if save_status:
+            self._save_files_status(files)
         return self.documents
 
+    def save_upload(self, name: str, stream) -> str:
+        """
+        Zapisuje przesłany plik do documents/ strumieniowo (kawałkami),
+        bez wczytywania całej zawartości do pamięci.
+
+        Plik trafia najpierw do pliku tymczasowego (rozszerzenie spoza
+        FILE_EXTENSIONS, więc load_documents go nie widzi) i jest
+        przenoszony do documents/ dopiero, gdy da się odczytać jego tekst.
+        Nieprawidłowy plik -> ValueError, a katalog documents/ zostaje bez zmian.
+        """
+        name = os.path.basename(name)
+        extension = os.path.splitext(name)[1].lower()
+        if extension not in self.FILE_EXTENSIONS:
+            raise ValueError(f"Nieobsługiwany typ pliku: {name}")
+
+        os.makedirs(self.DOCS_DIR_PATH, exist_ok=True)
+        path = os.path.join(self.DOCS_DIR_PATH, name)
+        tmp_path = path + ".upload"
+
+        try:
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(stream, f, self.UPLOAD_CHUNK_SIZE)
+            self._read_file(tmp_path, extension)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        os.replace(tmp_path, path)
+        return path
+
+    def add_document(self, name: str) -> int:
+        """
+        Wczytuje, przetwarza i kategoryzuje jeden dokument z documents/
+        i dodaje go do DocumentStore. Zwraca id dokumentu.
+
+        Plik statusu nie jest zmieniany - po zaindeksowaniu dokumentu w modelach
+        należy wywołać mark_indexed(). Dzięki temu dokument, którego nie udało się
+        zaindeksować, nadal jest wykrywany przez has_changes().
+        """
+        path = os.path.join(self.DOCS_DIR_PATH, name)
+        content = self._read_file(path)
+
+        doc_id = self.documents.add(
+            name=name,
+            mtime_ns=os.stat(path).st_mtime_ns,
+            content=self.preprocess_text(content),
+            category=self._detect_category(content)
+        )
+
+        return doc_id
+
+    def mark_indexed(self, name: str) -> None:
+        """
+        Zapisuje dokument w pliku statusu jako aktualny (zaindeksowany).
+        """
+        self._update_file_status(name)
+
     def _detect_category(self, text: str) -> str:
         """
         Zaawansowana kategoryzacja oparta na wagach słów kluczowych.
@@ -236,11 +330,58 @@ class DocumentService:
             if f.endswith(self.FILE_EXTENSIONS)
         ]
 
-    @staticmethod
-    def _read_file(path: str) -> str:
+    @classmethod
+    def _read_file(cls, path: str, extension: str | None = None) -> str:
+        """
+        Tekst pliku; rozszerzenie można podać jawnie (plik tymczasowy uploadu).
+        Plik, z którego nie da się odczytać tekstu -> ValueError.
+        """
+        extension = extension or os.path.splitext(path)[1].lower()
+        if extension == ".docx":
+            return cls._read_docx(path)
+
         with open(path, "r", encoding="utf-8", errors="ignore") as f:
             return f.read()
 
+    @classmethod
+    def _read_docx(cls, path: str) -> str:
+        """
+        Tekst z .docx bez dodatkowych bibliotek: .docx to archiwum zip,
+        treść leży w word/document.xml (akapity w:p, fragmenty tekstu w:t).
+        """
+        try:
+            with zipfile.ZipFile(path) as archive:
+                root = ET.fromstring(archive.read("word/document.xml"))
+        except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+            raise ValueError(f"Nieprawidłowy plik .docx: {e}") from e
+
+        paragraphs = [
+            "".join(node.text or "" for node in p.iter(f"{cls._DOCX_NS}t"))
+            for p in root.iter(f"{cls._DOCX_NS}p")
+        ]
+        return "\n".join(p for p in paragraphs if p)
+
+    def _load_corpus_cache(self) -> dict:
+        if not os.path.exists(self.CORPUS_CACHE_FILE):
+            return {}
+
+        with open(self.CORPUS_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+        if cache.get("version") != self.CORPUS_CACHE_VERSION:
+            return {}
+        return cache["documents"]
+
+    def _save_corpus_cache(self, documents: dict) -> None:
+        os.makedirs(os.path.dirname(self.CORPUS_CACHE_FILE), exist_ok=True)
+
+        # kilka sesji/procesów może wczytywać korpus naraz - wspólny plik tymczasowy pod blokadą
+        with FileLock(self.CORPUS_CACHE_FILE + ".lock"):
+            tmp_path = self.CORPUS_CACHE_FILE + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.CORPUS_CACHE_VERSION, "documents": documents}, f)
+            os.replace(tmp_path, self.CORPUS_CACHE_FILE)
+
     def _save_files_status(self, files: list[str]) -> None:
         os.makedirs(os.path.dirname(self.DOCS_STATUS_FILE), exist_ok=True)
 
@@ -251,3 +392,18 @@ class DocumentService:
 
         with open(self.DOCS_STATUS_FILE, "w", encoding="utf-8") as f:
             json.dump(status, f)
+
+    def _update_file_status(self, file: str) -> None:
+        # odczyt-zmiana-zapis pod blokadą: uploady z kilku sesji naraz
+        with FileLock(self.DOCS_STATUS_FILE + ".lock"):
+            status = {}
+            if os.path.exists(self.DOCS_STATUS_FILE):
+                with open(self.DOCS_STATUS_FILE, "r", encoding="utf-8") as f:
+                    status = json.load(f)
+
+            status[file] = os.path.getmtime(os.path.join(self.DOCS_DIR_PATH, file))
+
+            tmp_path = self.DOCS_STATUS_FILE + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.DOCS_STATUS_FILE)
@@ -0,0 +1,54 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Wyłączna blokada na pliku - działa między procesami (aplikacja, main.py)
+    i między wątkami jednego procesu (sesje Streamlit), bo każde wejście
+    otwiera własny deskryptor pliku.
+
+        with FileLock("data/index.lock"):
+            ...
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a+b")
+
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            # msvcrt nie czeka bez limitu - ponawiamy nieblokującą próbę
+            while True:
+                try:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(self.POLL_INTERVAL)
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
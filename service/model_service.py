@@ -3,6 +3,7 @@ import json
 import joblib
 import numpy as np
 
+from functools import lru_cache
 from gensim.models import Doc2Vec
 from gensim.models.doc2vec import TaggedDocument
 
@@ -10,26 +11,88 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from service.document_service import DocumentService
+from model.document_store import DocumentStore
+from service.tfidf_index import TfidfIndex
+from service.sharded_index import ShardedIndex
+from service.search_cache import SearchCache
+from service.file_lock import FileLock
 
 class ModelService:
     DOC2VEC_MODEL_PATH = "data/doc2vec.model"
     DOC2VEC_VECTORS_PATH = "data/doc2vec_vectors.json"
-    TFIDF_MODEL_PATH = "data/tfidf_model.pkl"
-
-    def __init__(self, documents):
+    DOC2VEC_VECTORS_DELTA_PATH = "data/doc2vec_vectors.delta.jsonl"  # wektory dodanych dokumentów
+    TFIDF_MODEL_PATH = "data/tfidf_model.pkl"  # stary format (joblib), tylko do migracji
+    TFIDF_INDEX_PATH = "data/tfidf_index"
+    BEST_PARAMS_PATH = "data/best_params.json"  # wynik strojenia (tune.py)
+    INDEX_LOCK_PATH = "data/index.lock"  # zapis indeksów przy dodawaniu dokumentów
+
+    # parametry domyślne - nadpisywane przez BEST_PARAMS_PATH, jeśli istnieje
+    DOC2VEC_PARAMS = {
+        "vector_size": 300,
+        "window": 10,
+        "min_count": 1,
+        "workers": 4,
+        "epochs": 200,
+        "dm": 0,
+        "dbow_words": 1,
+        "seed": 42,
+    }
+    TFIDF_PARAMS = {
+        "ngram_range": (1, 2),
+        "min_df": 1,
+        "max_df": 0.8,
+        "sublinear_tf": True,
+        "norm": "l2",
+    }
+
+    # liczba partycji indeksu przeszukiwanych równolegle (1 = bez shardowania);
+    # aplikacja i main.py ustawiają ją przez zmienną środowiskową SHARD_COUNT_ENV
+    SHARD_COUNT = 1
+    SHARD_COUNT_ENV = "PJN_SHARD_COUNT"
+
+    # cache wyników wyszukiwania: maks. liczba wpisów i czas życia w sekundach
+    SEARCH_CACHE_SIZE = 1024
+    SEARCH_CACHE_TTL = 300.0
+
+    # po tylu dodanych dokumentach delty (TF-IDF i wektory Doc2Vec) są scalane
+    DELTA_MAX_DOCS = 256
+
+    def __init__(self, documents, shard_count: int | None = None):
+        if not isinstance(documents, DocumentStore):
+            documents = DocumentStore.from_documents(documents)
         self.documents = documents
-        self.document_metadata = {d.name: d.category for d in documents}
-        self.document_names = [d.name for d in documents]
 
         self.doc2vec_model = None
         self.doc_vectors = None
+        # stan plików Doc2Vec na dysku wg ostatniego odczytu/zapisu tej instancji
+        self._doc2vec_stamp = None
+        self._vectors_stamp = None
+        self._vectors_delta_offset = 0
+        self._vectors_delta_size = 0
+
+        self.tfidf_index = None
 
-        self.tfidf_vectorizer = None
-        self.tfidf_matrix = None
+        self.shard_count = shard_count or self._shard_count_setting()
+        self.sharded_index = None
+        # shardy do przebudowy po trenowaniu - budowane raz, przed kolejnym wyszukiwaniem
+        self._shards_stale = False
+
+        # wersja modeli/indeksów - każda zmiana unieważnia cache wyników
+        self.index_version = 0
+        self.search_cache = SearchCache(self.SEARCH_CACHE_SIZE, self.SEARCH_CACHE_TTL)
 
         self.load_doc2vec()
         self.load_tfidf()
 
+        # odcisk DocumentStore, dla którego zaindeksowano ostatnie zmiany tej instancji
+        self._indexed_fingerprint = self.documents.fingerprint
+
+        if self.shard_count > 1:
+            self.sharded_index = ShardedIndex(self.shard_count)
+            if (self.tfidf_index.fingerprint is None
+                    or not self.sharded_index.is_current(self._shard_sources())):
+                self.build_shards()
+
     # =========================
     # Doc2Vec
     # =========================
@@ -43,16 +106,7 @@ class ModelService:
             for doc in self.documents
         ]
 
-        self.doc2vec_model = Doc2Vec(
-            vector_size=300,
-            window=10,
-            min_count=1,
-            workers=4,
-            epochs=200,
-            dm=0,
-            dbow_words=1,
-            seed=42
-        )
+        self.doc2vec_model = Doc2Vec(**self._model_params("doc2vec"))
 
         self.doc2vec_model.build_vocab(tagged_docs)
         self.doc2vec_model.train(
@@ -63,10 +117,15 @@ class ModelService:
 
         os.makedirs("data", exist_ok=True)
         self.doc2vec_model.save(self.DOC2VEC_MODEL_PATH)
+        self._doc2vec_stamp = self._file_stamp(self.DOC2VEC_MODEL_PATH)
 
         self._save_doc_vectors()
+        self._bump_version()
         print("Model Doc2Vec wytrenowany i zapisany.")
 
+        if self.sharded_index is not None:
+            self._shards_stale = True
+
     def load_doc2vec(self):
         if not os.path.exists(self.DOC2VEC_MODEL_PATH):
             print("Brak zapisanego modelu Doc2Vec — rozpoczynam trenowanie...")
@@ -75,6 +134,7 @@ class ModelService:
 
         print("Wczytywanie modelu Doc2Vec...")
         self.doc2vec_model = Doc2Vec.load(self.DOC2VEC_MODEL_PATH)
+        self._doc2vec_stamp = self._file_stamp(self.DOC2VEC_MODEL_PATH)
 
         if os.path.exists(self.DOC2VEC_VECTORS_PATH):
             self._load_doc_vectors()
@@ -82,32 +142,115 @@ class ModelService:
             print("Brak zapisanych wektorów dokumentów — generuję ponownie...")
             self._save_doc_vectors()
 
+        self._bump_version()
+
     def _save_doc_vectors(self):
         self.doc_vectors = {
-            doc.name: self.doc2vec_model.dv[doc.name].tolist()
-            for doc in self.documents
+            name: self.doc2vec_model.dv[name].tolist()
+            for name in self.documents.names
         }
 
-        with open(self.DOC2VEC_VECTORS_PATH, "w", encoding="utf-8") as f:
+        self._persist_doc_vectors()
+
+    def _persist_doc_vectors(self):
+        """
+        Zapisuje wszystkie wektory do jednego pliku i usuwa deltę
+        (już zawartą w zapisanym pliku).
+        """
+        tmp_path = self.DOC2VEC_VECTORS_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(self.doc_vectors, f)
+        os.replace(tmp_path, self.DOC2VEC_VECTORS_PATH)
+
+        if os.path.exists(self.DOC2VEC_VECTORS_DELTA_PATH):
+            os.remove(self.DOC2VEC_VECTORS_DELTA_PATH)
+
+        self._vectors_stamp = self._file_stamp(self.DOC2VEC_VECTORS_PATH)
+        self._vectors_delta_offset = 0
+        self._vectors_delta_size = 0
+
+    def _append_doc_vector(self, name: str, vector: list[float]):
+        """
+        Dopisuje wektor jednego dokumentu do pliku delty zamiast
+        ponownie zapisywać wszystkie wektory. Wymaga wcześniejszego
+        _refresh_doc2vec() pod blokadą, żeby offset delty był aktualny.
+        """
+        line = json.dumps({"name": name, "vector": vector}) + "\n"
+        with open(self.DOC2VEC_VECTORS_DELTA_PATH, "ab") as f:
+            f.write(line.encode("utf-8"))
+            self._vectors_delta_offset = f.tell()
+        self._vectors_delta_size += 1
 
     def _load_doc_vectors(self):
         with open(self.DOC2VEC_VECTORS_PATH, "r", encoding="utf-8") as f:
             self.doc_vectors = json.load(f)
 
+        self._vectors_stamp = self._file_stamp(self.DOC2VEC_VECTORS_PATH)
+        self._vectors_delta_offset = 0
+        self._vectors_delta_size = 0
+        self._read_vectors_delta()
+
+    def _read_vectors_delta(self):
+        """
+        Stosuje wpisy delty dopisane od ostatniego odczytu (również przez inne instancje).
+        """
+        if not os.path.exists(self.DOC2VEC_VECTORS_DELTA_PATH):
+            return
+
+        with open(self.DOC2VEC_VECTORS_DELTA_PATH, "rb") as f:
+            f.seek(self._vectors_delta_offset)
+            for line in f:
+                # niedokończony wpis - zostanie odczytany przy następnym odświeżeniu
+                if not line.endswith(b"\n"):
+                    break
+                self._vectors_delta_offset += len(line)
+
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self.doc_vectors[entry["name"]] = entry["vector"]
+                self._vectors_delta_size += 1
+
+    def _refresh_doc2vec(self):
+        """
+        Przechodzi na model/wektory zapisane przez inną instancję
+        (ponowne trenowanie, scalenie delty, nowe wpisy w delcie).
+        """
+        stamp = (self._doc2vec_stamp, self._vectors_stamp, self._vectors_delta_offset)
+
+        if self._file_stamp(self.DOC2VEC_MODEL_PATH) != self._doc2vec_stamp:
+            self.doc2vec_model = Doc2Vec.load(self.DOC2VEC_MODEL_PATH)
+            self._doc2vec_stamp = self._file_stamp(self.DOC2VEC_MODEL_PATH)
+            self._load_doc_vectors()
+        elif self._file_stamp(self.DOC2VEC_VECTORS_PATH) != self._vectors_stamp:
+            self._load_doc_vectors()
+        else:
+            self._read_vectors_delta()
+
+        if (self._doc2vec_stamp, self._vectors_stamp, self._vectors_delta_offset) != stamp:
+            self._bump_version()
+
     def search_doc2vec(self, query: str, top_n: int = 5, category: str = "Wszystkie"):
         if self.doc2vec_model is None:
             raise RuntimeError("Doc2Vec nie jest załadowany.")
 
-        query_processed = DocumentService.preprocess_text(query)
+        self._refresh_doc2vec()
+        return self._cached_search("doc2vec", query, top_n, category, self._search_doc2vec)
+
+    def _search_doc2vec(self, query_processed: str, top_n: int, category: str):
         query_tokens = query_processed.split()
 
         query_vector = self.doc2vec_model.infer_vector(query_tokens, epochs=100)
 
+        if self.sharded_index is not None:
+            self.ensure_shards()
+            return self.sharded_index.search_doc2vec(query_vector, top_n, category)
+
         results = []
         for name, vec in self.doc_vectors.items():
             # Filtrowanie po kategorii
-            if category != "Wszystkie" and self.document_metadata.get(name) != category:
+            if category != "Wszystkie" and self.documents.category_of(name) != category:
                 continue
 
             sim = cosine_similarity(
@@ -127,53 +270,294 @@ class ModelService:
         """
         TF-IDF na tekstach JUŻ po preprocessingu.
         """
-        self.tfidf_vectorizer = TfidfVectorizer(
-            ngram_range=(1, 2),
-            min_df=1,
-            max_df=0.8,
-            sublinear_tf=True,
-            norm="l2",
-            lowercase=False,
-        )
+        params = self._model_params("tfidf")
+        params["ngram_range"] = tuple(params["ngram_range"])
 
-        contents = [d.content for d in self.documents]
-        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(contents)
+        tfidf_vectorizer = TfidfVectorizer(lowercase=False, **params)
 
-        os.makedirs("data", exist_ok=True)
-        joblib.dump(
-            (self.tfidf_vectorizer, self.tfidf_matrix, self.document_names),
-            self.TFIDF_MODEL_PATH
+        contents = [self.documents.content(i) for i in range(len(self.documents))]
+        tfidf_matrix = tfidf_vectorizer.fit_transform(contents)
+
+        self.tfidf_index = TfidfIndex.from_vectorizer(
+            tfidf_vectorizer,
+            tfidf_matrix,
+            self.documents.names,
+            self.documents.fingerprint
         )
 
+        os.makedirs("data", exist_ok=True)
+        self.tfidf_index.save(self.TFIDF_INDEX_PATH)
+        self.tfidf_index = TfidfIndex.load(self.TFIDF_INDEX_PATH)
+        self._indexed_fingerprint = self.documents.fingerprint
+        self._bump_version()
+
         print("Model TF-IDF wytrenowany i zapisany.")
 
+        if self.sharded_index is not None:
+            self._shards_stale = True
+
     def load_tfidf(self):
-        if not os.path.exists(self.TFIDF_MODEL_PATH):
-            print("Brak zapisanego modelu TF-IDF — rozpoczynam trenowanie...")
-            self.train_tfidf()
-            return
+        if not TfidfIndex.exists(self.TFIDF_INDEX_PATH):
+            if os.path.exists(self.TFIDF_MODEL_PATH):
+                print("Konwersja modelu TF-IDF do nowego formatu...")
+                self._migrate_tfidf_pickle()
+            else:
+                print("Brak zapisanego modelu TF-IDF — rozpoczynam trenowanie...")
+                self.train_tfidf()
+                return
+
+        self.tfidf_index = TfidfIndex.load(self.TFIDF_INDEX_PATH)
+        self._bump_version()
+        print("Model TF-IDF wczytany.")
 
-        self.tfidf_vectorizer, self.tfidf_matrix, self.document_names = joblib.load(
+    def _migrate_tfidf_pickle(self):
+        tfidf_vectorizer, tfidf_matrix, document_names = joblib.load(
             self.TFIDF_MODEL_PATH
         )
-        print("Model TF-IDF wczytany.")
+
+        # pickle nie zapamiętał treści, z których go wytrenowano - odcisk nieznany,
+        # więc shardy zbudowane z tego indeksu nie będą uznane za aktualne
+        TfidfIndex.from_vectorizer(
+            tfidf_vectorizer,
+            tfidf_matrix,
+            document_names,
+            None
+        ).save(self.TFIDF_INDEX_PATH)
 
     def search_tfidf(self, query: str, top_n: int = 5, category: str = "Wszystkie"):
-        if self.tfidf_vectorizer is None:
+        if self.tfidf_index is None:
             raise RuntimeError("TF-IDF nie jest załadowany.")
 
-        query_processed = DocumentService.preprocess_text(query)
-        query_vector = self.tfidf_vectorizer.transform([query_processed])
+        self._refresh_tfidf()
+        return self._cached_search("tfidf", query, top_n, category, self._search_tfidf)
+
+    def _search_tfidf(self, query_processed: str, top_n: int, category: str):
+        query_vector = self.tfidf_index.transform([query_processed])
 
-        sims = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
+        if self.sharded_index is not None:
+            self.ensure_shards()
+            return self.sharded_index.search_tfidf(query_vector, top_n, category)
+
+        sims = self.tfidf_index.similarities(query_vector)
         
         results = []
-        for i, name in enumerate(self.document_names):
+        for name, sim in zip(self.tfidf_index.live_names(), sims):
             # Filtrowanie po kategorii
-            if category != "Wszystkie" and self.document_metadata.get(name) != category:
+            if category != "Wszystkie" and self.documents.category_of(name) != category:
                 continue
             
-            sim = sims[i]
             results.append((name, round(float(sim), 4)))
 
-        return sorted(results, key=lambda x: -x[1])[:top_n]
\ No newline at end of file
+        return sorted(results, key=lambda x: -x[1])[:top_n]
+
+    def _refresh_tfidf(self):
+        """
+        Przechodzi na wersję/deltę indeksu zapisaną przez inną instancję
+        (np. inną sesję Streamlit) - wtedy też unieważnia cache wyników.
+        """
+        stamp = (self.tfidf_index.version, self.tfidf_index.delta_stamp)
+        self.tfidf_index = self.tfidf_index.refresh(self.TFIDF_INDEX_PATH)
+        if (self.tfidf_index.version, self.tfidf_index.delta_stamp) != stamp:
+            self._bump_version()
+
+    def _model_params(self, engine: str) -> dict:
+        """
+        Parametry domyślne nadpisane najlepszymi parametrami ze strojenia.
+        """
+        params = dict(self.DOC2VEC_PARAMS if engine == "doc2vec" else self.TFIDF_PARAMS)
+
+        if os.path.exists(self.BEST_PARAMS_PATH):
+            with open(self.BEST_PARAMS_PATH, "r", encoding="utf-8") as f:
+                params.update(json.load(f).get(engine, {}))
+
+        return params
+
+    # =========================
+    # Dodawanie dokumentów
+    # =========================
+
+    def add_document(self, name: str):
+        """
+        Indeksuje jeden dokument (już dodany do DocumentStore) w obu silnikach
+        bez ponownego trenowania:
+        - TF-IDF: wiersz liczony na istniejącym słowniku i IDF
+        - Doc2Vec: wektor dokumentu z infer_vector()
+
+        Nowe wiersze i wektory są dopisywane do małych plików delty;
+        po DELTA_MAX_DOCS dokumentach delty są scalane z plikami głównymi.
+
+        Zapis odbywa się pod blokadą INDEX_LOCK_PATH, po ponownym odczycie
+        stanu z dysku - zmiany innych instancji (sesji Streamlit, procesów)
+        są scalane, a nie nadpisywane.
+        """
+        doc = self.documents.get(name)
+        if doc is None:
+            raise KeyError(f"Brak dokumentu {name} w DocumentStore.")
+
+        with FileLock(self.INDEX_LOCK_PATH):
+            self._refresh_tfidf()
+            self._refresh_doc2vec()
+
+            # odczytany raz - DocumentStore może się zmieniać równolegle (inne wątki sesji)
+            fingerprint = self.documents.fingerprint
+
+            self.tfidf_index.upsert(doc.name, doc.content)
+            # odcisk z dysku (z dokumentami innych instancji) + zmiany w tym DocumentStore
+            self.tfidf_index.fingerprint = DocumentStore.combine_fingerprints(
+                self.tfidf_index.fingerprint,
+                self._indexed_fingerprint,
+                fingerprint
+            )
+            if self.tfidf_index.delta_size >= self.DELTA_MAX_DOCS:
+                self.tfidf_index.save(self.TFIDF_INDEX_PATH)
+                self.tfidf_index = TfidfIndex.load(self.TFIDF_INDEX_PATH)
+            else:
+                self.tfidf_index.save_delta(self.TFIDF_INDEX_PATH)
+            self._indexed_fingerprint = fingerprint
+
+            vector = self.doc2vec_model.infer_vector(doc.content.split(), epochs=100).tolist()
+            self.doc_vectors[doc.name] = vector
+            if self._vectors_delta_size + 1 >= self.DELTA_MAX_DOCS:
+                self._persist_doc_vectors()
+            else:
+                self._append_doc_vector(doc.name, vector)
+
+            if self.sharded_index is not None and not self._shards_stale:
+                self.sharded_index.add_document(
+                    doc.name,
+                    self.documents,
+                    self.tfidf_index,
+                    self._doc_vector
+                )
+                self.sharded_index.update_sources(
+                    self._shard_sources(corpus=self.tfidf_index.fingerprint)
+                )
+
+        self._bump_version()
+        print(f"Dokument {doc.name} dodany do indeksów.")
+
+    # =========================
+    # Shardy
+    # =========================
+
+    def build_shards(self):
+        """
+        Dzieli korpus na shardy (TF-IDF + wektory Doc2Vec) do równoległego wyszukiwania.
+        """
+        self.sharded_index.build(
+            self.documents,
+            self.tfidf_index,
+            self._doc_vector,
+            self._shard_sources()
+        )
+        self._shards_stale = False
+        self._bump_version()
+        print(f"Zbudowano {self.shard_count} shardów indeksu.")
+
+    def ensure_shards(self):
+        """
+        Buduje shardy, jeśli modele zostały ponownie wytrenowane od ostatniej budowy.
+        Dzięki temu trenowanie obu silników po kolei buduje shardy tylko raz.
+        """
+        if self._shards_stale:
+            self.build_shards()
+
+    def close(self):
+        """
+        Zamyka procesy robocze wyszukiwania równoległego.
+        Należy wywołać przed porzuceniem instancji ModelService.
+        """
+        if self.sharded_index is not None:
+            self.sharded_index.close()
+
+    def rebuild_shard(self, shard_id: int):
+        """
+        Przebudowuje pojedynczy shard bez dotykania pozostałych.
+        """
+        if self.sharded_index is None:
+            raise RuntimeError("Shardowanie nie jest włączone.")
+
+        self.sharded_index.rebuild_shard(
+            shard_id,
+            self.documents,
+            self.tfidf_index,
+            self._doc_vector
+        )
+        self._bump_version()
+
+    @classmethod
+    def _shard_count_setting(cls) -> int:
+        """
+        Liczba shardów ze zmiennej środowiskowej SHARD_COUNT_ENV lub SHARD_COUNT.
+        """
+        value = os.environ.get(cls.SHARD_COUNT_ENV, "").strip()
+        if not value:
+            return cls.SHARD_COUNT
+
+        try:
+            shard_count = int(value)
+        except ValueError:
+            shard_count = 0
+        if shard_count < 1:
+            raise ValueError(
+                f"{cls.SHARD_COUNT_ENV} musi być dodatnią liczbą całkowitą, otrzymano {value!r}."
+            )
+        return shard_count
+
+    def _shard_sources(self, corpus: str | None = None) -> dict:
+        """
+        Z czego zbudowano shardy: korpus, konkretna wersja indeksu TF-IDF
+        i plik modelu Doc2Vec. Ponowne trenowanie (również poza shardowaniem,
+        np. w main.py) zmienia te wartości, więc shardy zostaną przebudowane.
+        corpus - odcisk korpusu, jeśli shardy obejmują więcej niż ten DocumentStore
+        (dokumenty dodane przez inne instancje).
+        """
+        model_stat = os.stat(self.DOC2VEC_MODEL_PATH)
+        return {
+            "corpus": corpus or self.documents.fingerprint,
+            "tfidf_version": self.tfidf_index.version,
+            "tfidf_fingerprint": self.tfidf_index.fingerprint,
+            "vocabulary_size": len(self.tfidf_index.terms),
+            "doc2vec_model": f"{model_stat.st_mtime_ns}-{model_stat.st_size}",
+        }
+
+    def _doc_vector(self, name: str):
+        if name in self.doc_vectors:
+            return self.doc_vectors[name]
+        content = self.documents.content(self.documents.id_of(name))
+        return self.doc2vec_model.infer_vector(content.split(), epochs=100)
+
+    @staticmethod
+    def _file_stamp(path: str) -> tuple[int, int] | None:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    # =========================
+    # Cache wyników
+    # =========================
+
+    def _cached_search(self, engine: str, query: str, top_n: int, category: str, search):
+        """
+        Zwraca wynik z cache lub liczy go funkcją search(query_processed, top_n, category).
+        Kluczem jest zapytanie PO preprocessingu, więc warianty różniące się
+        wielkością liter czy interpunkcją trafiają w ten sam wpis.
+        """
+        query_processed = self._preprocess_query(query)
+        key = (engine, query_processed, category, top_n)
+
+        results = self.search_cache.get(key, self.index_version)
+        if results is None:
+            results = search(query_processed, top_n, category)
+            self.search_cache.put(key, self.index_version, results)
+
+        return results
+
+    def _bump_version(self):
+        self.index_version += 1
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _preprocess_query(query: str) -> str:
+        return DocumentService.preprocess_text(query)
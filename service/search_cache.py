@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+
+
+class SearchCache:
+    """
+    Ograniczony cache wyników wyszukiwania (LRU + TTL).
+
+    Każdy odczyt i zapis podaje aktualną wersję modelu/indeksu.
+    Zmiana wersji (np. po ponownym trenowaniu) czyści cały cache,
+    więc nie trzeba go ręcznie unieważniać.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float | None = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._version = None
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key, version):
+        self._check_version(version)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        created, value = entry
+        if self.ttl is not None and time.monotonic() - created > self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(value)
+
+    def put(self, key, version, value) -> None:
+        self._check_version(version)
+
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic(), tuple(value))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_version(self, version) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
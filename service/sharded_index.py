@@ -0,0 +1,336 @@
+import os
+import json
+import heapq
+import zlib
+import multiprocessing
+import weakref
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix, vstack
+
+from service.tfidf_index import TfidfIndex
+from service.versioned_dir import VersionedDir
+
+
+# cache shardów wczytanych w procesie roboczym: (shard, katalog wersji) -> shard
+_SHARD_CACHE = {}
+
+
+class ShardedIndex:
+    """
+    Indeks podzielony na N partycji (shardów) przeszukiwanych równolegle.
+
+    data/shards/manifest.json opisuje, z czego zbudowano shardy (odcisk korpusu,
+    wersja i rozmiar słownika TF-IDF, identyfikator modelu Doc2Vec) - zmiana
+    któregokolwiek z nich oznacza, że shardy trzeba przebudować.
+
+    Każdy shard to katalog wersji data/shards/shard_<i>/<wersja>/ (VersionedDir) z:
+    - tfidf_data.npy / tfidf_indices.npy / tfidf_indptr.npy - wiersze macierzy TF-IDF
+      (kolumny zgodne z globalnym słownikiem TfidfIndex)
+    - doc2vec.npy - znormalizowane wektory Doc2Vec (float32)
+    - manifest.json - nazwy i kategorie dokumentów
+
+    Dokument trafia do shardu crc32(nazwa) % N, więc dodanie lub zmiana
+    dokumentu dotyczy tylko jednego shardu, który można przebudować niezależnie.
+    Procesy robocze mapują shardy przez mmap, więc nie kopiują ich do pamięci.
+    Każde wyszukiwanie odczytuje aktualne wersje shardów (pliki CURRENT), więc
+    widzi shardy przebudowane przez inne instancje.
+    Pula startuje procesy metodą "spawn" (bez fork z wielowątkowego serwera
+    Streamlit) i powinna zostać zamknięta przez close(). Pula porzuconej instancji
+    (np. zakończonej sesji Streamlit) jest zamykana przy jej usuwaniu z pamięci.
+    """
+
+    SHARDS_DIR = "data/shards"
+    MANIFEST_FILE = "manifest.json"
+    FORMAT_VERSION = 2
+
+    def __init__(self, shard_count: int, shards_dir: str = SHARDS_DIR, workers: int | None = None):
+        if shard_count < 1:
+            raise ValueError("Liczba shardów musi być dodatnia.")
+
+        self.shard_count = shard_count
+        self.shards_dir = shards_dir
+        self.workers = workers or min(shard_count, os.cpu_count() or 1)
+
+        self._shard_versions = {}
+        self._executor = None
+        self._executor_finalizer = None
+
+    # =========================
+    # Budowa shardów
+    # =========================
+
+    def shard_of(self, name: str) -> int:
+        return zlib.crc32(name.encode("utf-8")) % self.shard_count
+
+    def is_current(self, sources: dict) -> bool:
+        """
+        Sprawdza, czy na dysku jest komplet shardów zbudowany z tych samych
+        źródeł (korpus + wersje modeli), co aktualnie wczytane.
+        """
+        manifest = self._read_manifest(self.shards_dir)
+        if manifest is None:
+            return False
+
+        if (manifest.get("format_version") != self.FORMAT_VERSION
+                or manifest["shard_count"] != self.shard_count
+                or manifest["sources"] != sources):
+            return False
+
+        return self._load_versions()
+
+    def build(self, documents, tfidf_index: TfidfIndex, doc_vector, sources: dict) -> None:
+        """
+        Buduje wszystkie shardy z dokumentów w DocumentStore.
+        doc_vector(name) zwraca wektor Doc2Vec dokumentu.
+        """
+        os.makedirs(self.shards_dir, exist_ok=True)
+
+        # podział nazw na shardy w jednym przejściu po korpusie
+        members = {shard_id: [] for shard_id in range(self.shard_count)}
+        for name in documents.names:
+            members[self.shard_of(name)].append(name)
+
+        for shard_id in range(self.shard_count):
+            self.rebuild_shard(shard_id, documents, tfidf_index, doc_vector, members[shard_id])
+
+        self.update_sources(sources)
+
+    def update_sources(self, sources: dict) -> None:
+        """
+        Zapisuje źródła, dla których shardy są aktualne
+        (po budowie lub przebudowie pojedynczych shardów).
+        """
+        tmp_path = os.path.join(self.shards_dir, self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": self.FORMAT_VERSION,
+                "shard_count": self.shard_count,
+                "sources": sources,
+            }, f)
+        os.replace(tmp_path, os.path.join(self.shards_dir, self.MANIFEST_FILE))
+
+    def add_document(self, name: str, documents, tfidf_index: TfidfIndex, doc_vector) -> None:
+        """
+        Przebudowuje shard dodanego (lub zmienionego) dokumentu. Skład shardu
+        jest brany z jego manifestu, więc korpus nie jest przeglądany.
+        """
+        shard_id = self.shard_of(name)
+
+        names, categories = None, None
+        version_path = VersionedDir(self._shard_path(shard_id)).current()
+        manifest = None if version_path is None else self._read_manifest(version_path)
+        if manifest is not None:
+            names = manifest["document_names"]
+            # dokumenty dodane przez inne instancje nie muszą być w tym DocumentStore
+            categories = dict(zip(names, manifest["categories"]))
+            if name not in names:
+                names.append(name)
+
+        self.rebuild_shard(shard_id, documents, tfidf_index, doc_vector, names, categories)
+
+    def rebuild_shard(self, shard_id: int, documents, tfidf_index: TfidfIndex, doc_vector,
+                      names: list[str] | None = None, categories: dict | None = None) -> None:
+        """
+        Przebudowuje jeden shard z dokumentów, które do niego należą
+        (names - nazwy dokumentów shardu, jeśli są już znane; categories - ich
+        kategorie z manifestu shardu dla dokumentów spoza DocumentStore).
+        Wiersze TF-IDF są brane z indeksu (macierz główna lub delta), a dla
+        dokumentów spoza indeksu liczone przez transform() na globalnym słowniku.
+        doc_vector(name) zwraca wektor Doc2Vec dokumentu.
+        """
+        if names is None:
+            names = [name for name in documents.names if self.shard_of(name) == shard_id]
+        categories = categories or {}
+
+        indexed, not_indexed, doc_categories = [], [], {}
+        for name in names:
+            category = documents.category_of(name) or categories.get(name)
+            if name in tfidf_index and category is not None:
+                indexed.append(name)
+            elif name in documents:
+                not_indexed.append(name)
+            else:
+                continue
+            doc_categories[name] = category
+        docs = indexed + not_indexed
+
+        if docs:
+            tfidf_rows = vstack([
+                tfidf_index.rows(indexed),
+                tfidf_index.transform([
+                    documents.content(documents.id_of(name)) for name in not_indexed
+                ]),
+            ]).tocsr()
+
+            vectors = np.asarray([doc_vector(name) for name in docs], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        else:
+            tfidf_rows = csr_matrix((0, len(tfidf_index.terms)), dtype=np.float32)
+            vectors = np.zeros((0, 0), dtype=np.float32)
+
+        versions = VersionedDir(self._shard_path(shard_id))
+        tmp_path = versions.new_version()
+
+        np.save(os.path.join(tmp_path, "tfidf_data.npy"), tfidf_rows.data.astype(np.float32))
+        np.save(os.path.join(tmp_path, "tfidf_indices.npy"), tfidf_rows.indices)
+        np.save(os.path.join(tmp_path, "tfidf_indptr.npy"), tfidf_rows.indptr)
+        np.save(os.path.join(tmp_path, "doc2vec.npy"), vectors)
+
+        with open(os.path.join(tmp_path, self.MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "shape": list(tfidf_rows.shape),
+                "document_names": docs,
+                "categories": [doc_categories[name] for name in docs],
+            }, f)
+
+        versions.publish(tmp_path)
+        self._shard_versions[shard_id] = tmp_path
+
+    # =========================
+    # Wyszukiwanie
+    # =========================
+
+    def search_tfidf(self, query_vector: csr_matrix, top_n: int, category: str):
+        query = (query_vector.indices, query_vector.data)
+        return self._search("tfidf", query, top_n, category)
+
+    def search_doc2vec(self, query_vector: np.ndarray, top_n: int, category: str):
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self._search("doc2vec", query, top_n, category)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor_finalizer.detach()
+            self._executor.shutdown()
+            self._executor = None
+
+    def _search(self, engine: str, query, top_n: int, category: str):
+        if not self._load_versions():
+            raise RuntimeError("Shardy nie są zbudowane.")
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            # finalizer trzyma tylko pulę, nie instancję - nie blokuje jej usunięcia
+            self._executor_finalizer = weakref.finalize(
+                self, self._executor.shutdown, wait=False
+            )
+
+        try:
+            partial = self._score_shards(engine, query, top_n, category)
+        except FileNotFoundError:
+            # wersja usunięta między odczytem CURRENT a wczytaniem shardu
+            if not self._load_versions():
+                raise RuntimeError("Shardy nie są zbudowane.")
+            partial = self._score_shards(engine, query, top_n, category)
+
+        return heapq.nlargest(top_n, partial, key=lambda x: x[1])
+
+    def _score_shards(self, engine: str, query, top_n: int, category: str) -> list:
+        futures = [
+            self._executor.submit(
+                _score_shard,
+                shard_id,
+                version_path,
+                engine,
+                query,
+                top_n,
+                category
+            )
+            for shard_id, version_path in self._shard_versions.items()
+        ]
+
+        return [result for future in futures for result in future.result()]
+
+    # =========================
+    # Metody pomocnicze (private)
+    # =========================
+
+    def _shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.shards_dir, f"shard_{shard_id}")
+
+    def _load_versions(self) -> bool:
+        versions = {}
+        for shard_id in range(self.shard_count):
+            version_path = VersionedDir(self._shard_path(shard_id)).current()
+            if version_path is None:
+                return False
+            versions[shard_id] = version_path
+
+        self._shard_versions = versions
+        return True
+
+    @classmethod
+    def _read_manifest(cls, path: str) -> dict | None:
+        manifest_path = os.path.join(path, cls.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+# =========================
+# Proces roboczy
+# =========================
+
+def _load_shard(shard_id: int, path: str) -> dict:
+    key = (shard_id, path)
+    if key not in _SHARD_CACHE:
+        # nieaktualne wersje tego shardu nie są już potrzebne
+        for stale in [k for k in _SHARD_CACHE if k[0] == shard_id]:
+            del _SHARD_CACHE[stale]
+
+        with open(os.path.join(path, ShardedIndex.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        def _load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        _SHARD_CACHE[key] = {
+            "names": manifest["document_names"],
+            "categories": np.asarray(manifest["categories"]),
+            "tfidf": csr_matrix(
+                (_load("tfidf_data.npy"), _load("tfidf_indices.npy"), _load("tfidf_indptr.npy")),
+                shape=tuple(manifest["shape"]),
+                copy=False
+            ),
+            "doc2vec": _load("doc2vec.npy"),
+        }
+
+    return _SHARD_CACHE[key]
+
+
+def _score_shard(shard_id: int, path: str, engine: str, query, top_n: int, category: str):
+    shard = _load_shard(shard_id, path)
+    if not shard["names"]:
+        return []
+
+    if engine == "tfidf":
+        indices, data = query
+        matrix = shard["tfidf"]
+        query_vector = csr_matrix(
+            (data, indices, [0, len(indices)]),
+            shape=(1, matrix.shape[1])
+        )
+        sims = np.asarray((matrix @ query_vector.T).todense()).ravel()
+    else:
+        sims = shard["doc2vec"] @ query
+
+    candidates = np.arange(len(sims))
+    if category != "Wszystkie":
+        candidates = candidates[shard["categories"] == category]
+
+    if len(candidates) > top_n:
+        top = np.argpartition(-sims[candidates], top_n - 1)[:top_n]
+        candidates = candidates[top]
+
+    return [(shard["names"][i], round(float(sims[i]), 4)) for i in candidates]
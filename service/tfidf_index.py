@@ -0,0 +1,446 @@
+import os
+import json
+import bisect
+import numpy as np
+
+from collections import Counter
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from service.versioned_dir import VersionedDir
+
+
+class TfidfIndex:
+    """
+    Wersjonowany, kompaktowy format indeksu TF-IDF na dysku.
+
+    Każdy zapis tworzy nową wersję (VersionedDir: <katalog>/<wersja>/ + plik CURRENT),
+    więc katalog zmapowany przez działający proces nie jest usuwany ani nadpisywany.
+    Instancje, które wczytały starszą wersję, przechodzą na aktualną przez refresh().
+
+    Katalog wersji zawiera:
+    - data.npy / indices.npy / indptr.npy - tablice macierzy CSR (mmap)
+    - terms.bin.npy / term_offsets.npy - posortowany słownik jako jeden bufor UTF-8
+      i granice termów (indeks termu = numer kolumny)
+    - idf.npy - wagi IDF (float32)
+    - manifest.json - wersja formatu, parametry analizatora,
+      nazwy dokumentów i odcisk korpusu
+    - delta.npz (opcjonalnie) - segment delty: wiersze dokumentów dodanych
+      lub zmienionych po zapisie wersji, nadpisywany w całości przy każdym
+      dodaniu (jest mały); scalany z macierzą główną przez compact()
+
+    Zapytania są wektoryzowane bez rozpakowywania słownika do dict:
+    termy wyszukiwane są binarnie w posortowanej tablicy.
+    """
+
+    FORMAT_VERSION = 2
+    MANIFEST_FILE = "manifest.json"
+    DELTA_FILE = "delta.npz"
+
+    # parametry TfidfVectorizer potrzebne do odtworzenia wektoryzacji zapytań
+    ANALYZER_PARAMS = ("ngram_range", "lowercase", "token_pattern", "sublinear_tf", "norm")
+
+    def __init__(self, matrix, terms, idf, document_names, fingerprint, params):
+        self.matrix = matrix
+        self.terms = terms
+        self.idf = idf
+        self.document_names = document_names
+        self.fingerprint = fingerprint
+        self.params = params
+
+        # nazwa katalogu wersji, z której wczytano indeks (None przed zapisem)
+        self.version = None
+
+        # segment delty: wiersze dodane po zapisie wersji + zastąpione wiersze macierzy
+        self.delta = csr_matrix((0, len(terms)), dtype=np.float32)
+        self.delta_names = []
+        self.tombstones = set()
+
+        # nazwa -> numer wiersza (liczone przy pierwszym użyciu)
+        self._rows = None
+        self._delta_rows = {}
+
+        # (mtime_ns, rozmiar) wczytanego pliku delty - do wykrywania zmian z innych instancji
+        self.delta_stamp = None
+
+        self._analyzer = TfidfVectorizer(
+            ngram_range=tuple(params["ngram_range"]),
+            lowercase=params["lowercase"],
+            token_pattern=params["token_pattern"],
+        ).build_analyzer()
+
+    # =========================
+    # Budowa / zapis / odczyt
+    # =========================
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, matrix, document_names, fingerprint):
+        """
+        Tworzy indeks z wytrenowanego TfidfVectorizer i macierzy dokumentów.
+        fingerprint - odcisk korpusu, z którego zbudowano macierz, lub None, gdy nieznany.
+        """
+        params = {key: vectorizer.get_params()[key] for key in cls.ANALYZER_PARAMS}
+        # similarities() i _vectorize_counts() zakładają wiersze znormalizowane L2
+        if params["norm"] != "l2":
+            raise ValueError(
+                f"Nieobsługiwana normalizacja TF-IDF: {params['norm']!r} (wymagana 'l2')."
+            )
+        params["ngram_range"] = list(params["ngram_range"])
+
+        # sklearn numeruje kolumny w kolejności alfabetycznej termów
+        terms = TermArray.from_terms(vectorizer.get_feature_names_out())
+        idf = np.asarray(vectorizer.idf_, dtype=np.float32)
+
+        return cls(
+            csr_matrix(matrix, dtype=np.float32),
+            terms,
+            idf,
+            list(document_names),
+            fingerprint,
+            params
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Zapisuje indeks jako nową wersję w katalogu path i publikuje ją
+        dopiero po zapisaniu wszystkich plików. Delta jest wcześniej scalana.
+        """
+        self.compact()
+
+        versions = VersionedDir(path)
+        tmp_path = versions.new_version()
+
+        matrix = csr_matrix(self.matrix)
+        np.save(os.path.join(tmp_path, "data.npy"), matrix.data.astype(np.float32))
+        # indices i indptr w typie wybranym przez scipy - inaczej load() robiłby kopię
+        np.save(os.path.join(tmp_path, "indices.npy"), matrix.indices)
+        np.save(os.path.join(tmp_path, "indptr.npy"), matrix.indptr)
+        np.save(os.path.join(tmp_path, "terms.bin.npy"), self.terms.buffer)
+        np.save(os.path.join(tmp_path, "term_offsets.npy"), self.terms.offsets)
+        np.save(os.path.join(tmp_path, "idf.npy"), self.idf.astype(np.float32))
+
+        manifest = {
+            "format_version": self.FORMAT_VERSION,
+            "shape": list(matrix.shape),
+            "params": self.params,
+            "fingerprint": self.fingerprint,
+            "document_names": self.document_names,
+        }
+        with open(os.path.join(tmp_path, self.MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        versions.publish(tmp_path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "TfidfIndex":
+        """
+        Wczytuje aktualną wersję indeksu. Przy mmap=True tablice są mapowane
+        z pliku (bez kopiowania), więc procesy czytające ten sam indeks
+        współdzielą strony pamięci systemu operacyjnego.
+        """
+        path = VersionedDir(path).current()
+        if path is None:
+            raise FileNotFoundError("Brak zapisanego indeksu TF-IDF.")
+
+        with open(os.path.join(path, cls.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("format_version") != cls.FORMAT_VERSION:
+            raise ValueError(
+                f"Nieobsługiwana wersja indeksu TF-IDF: {manifest.get('format_version')}"
+            )
+
+        mmap_mode = "r" if mmap else None
+
+        def _load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+        matrix = csr_matrix(
+            (_load("data.npy"), _load("indices.npy"), _load("indptr.npy")),
+            shape=tuple(manifest["shape"]),
+            copy=False
+        )
+
+        index = cls(
+            matrix,
+            TermArray(_load("terms.bin.npy"), _load("term_offsets.npy")),
+            _load("idf.npy"),
+            manifest["document_names"],
+            manifest["fingerprint"],
+            manifest["params"]
+        )
+        index.version = os.path.basename(path)
+
+        delta_path = os.path.join(path, cls.DELTA_FILE)
+        if os.path.exists(delta_path):
+            index._load_delta(delta_path)
+
+        return index
+
+    def refresh(self, path: str) -> "TfidfIndex":
+        """
+        Zwraca aktualny indeks z katalogu path: nowo wczytaną wersję, jeśli inna
+        instancja opublikowała nową, albo ten sam obiekt z deltą odczytaną
+        ponownie, jeśli zmienił się jej plik. Koszt: odczyt CURRENT i stat delty.
+        """
+        current = VersionedDir(path).current()
+        if current is None:
+            raise FileNotFoundError("Brak zapisanego indeksu TF-IDF.")
+
+        if os.path.basename(current) != self.version:
+            return self.load(path)
+
+        delta_path = os.path.join(current, self.DELTA_FILE)
+        if os.path.exists(delta_path) and self._stat(delta_path) != self.delta_stamp:
+            self._load_delta(delta_path)
+
+        return self
+
+    def save_delta(self, path: str) -> None:
+        """
+        Zapisuje sam segment delty do wczytanej wersji indeksu w katalogu path.
+        Koszt zależy od rozmiaru delty, a nie całego indeksu.
+        """
+        if self.version is None:
+            raise RuntimeError("Indeks nie został zapisany - brak wersji dla delty.")
+
+        version_path = os.path.join(path, self.version)
+        if not os.path.isdir(version_path):
+            raise FileNotFoundError(
+                f"Wersja indeksu {self.version} nie istnieje - wywołaj refresh() przed zapisem delty."
+            )
+
+        delta_path = os.path.join(version_path, self.DELTA_FILE)
+        tmp_path = delta_path + ".tmp"
+
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                data=self.delta.data,
+                indices=self.delta.indices,
+                indptr=self.delta.indptr,
+                names=np.asarray(self.delta_names, dtype=str),
+                tombstones=np.asarray(sorted(self.tombstones), dtype=np.int64),
+                # npz nie zapisze None bez pickle - nieznany odcisk jako ""
+                fingerprint=np.asarray(self.fingerprint or ""),
+            )
+        os.replace(tmp_path, delta_path)
+        self.delta_stamp = self._stat(delta_path)
+
+    def _load_delta(self, delta_path: str) -> None:
+        with np.load(delta_path) as delta:
+            self.delta_names = delta["names"].tolist()
+            self.delta = csr_matrix(
+                (delta["data"], delta["indices"], delta["indptr"]),
+                shape=(len(self.delta_names), len(self.terms))
+            )
+            self.tombstones = set(delta["tombstones"].tolist())
+            self.fingerprint = str(delta["fingerprint"]) or None
+
+        self._delta_rows = {name: i for i, name in enumerate(self.delta_names)}
+        self.delta_stamp = self._stat(delta_path)
+
+    @staticmethod
+    def _stat(path: str) -> tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        """
+        Czy w katalogu jest indeks w obsługiwanej wersji formatu
+        (starsze wersje są traktowane jak brak indeksu i trenowane od nowa).
+        """
+        path = VersionedDir(path).current()
+        if path is None:
+            return False
+
+        manifest_path = os.path.join(path, cls.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return False
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("format_version") == cls.FORMAT_VERSION
+
+    # =========================
+    # Wektoryzacja i podobieństwo
+    # =========================
+
+    def transform(self, texts: list[str]) -> csr_matrix:
+        """
+        Odpowiednik TfidfVectorizer.transform na posortowanym słowniku.
+        """
+        data, indices, indptr = [], [], [0]
+
+        for text in texts:
+            counts = Counter(self._analyzer(text))
+            row = self._vectorize_counts(counts)
+
+            for col, value in sorted(row.items()):
+                indices.append(col)
+                data.append(value)
+            indptr.append(len(indices))
+
+        return csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), indptr),
+            shape=(len(texts), len(self.terms))
+        )
+
+    def upsert(self, name: str, content: str) -> None:
+        """
+        Dodaje (lub podmienia) wiersz dokumentu bez ponownego dopasowania modelu:
+        słownik i IDF zostają bez zmian, nowe termy są pomijane.
+
+        Wiersz trafia do segmentu delty - macierz główna (mmap) nie jest kopiowana,
+        a jej wiersz zastąpionego dokumentu jest tylko oznaczany jako usunięty.
+        """
+        row = self.transform([content])
+
+        if name in self._delta_rows:
+            i = self._delta_rows[name]
+            self.delta = vstack([self.delta[:i], row, self.delta[i + 1:]]).tocsr()
+            return
+
+        base_row = self._base_rows().get(name)
+        if base_row is not None:
+            self.tombstones.add(base_row)
+
+        self._delta_rows[name] = len(self.delta_names)
+        self.delta_names.append(name)
+        self.delta = vstack([self.delta, row]).tocsr()
+
+    @property
+    def delta_size(self) -> int:
+        return len(self.delta_names)
+
+    def compact(self) -> None:
+        """
+        Scala deltę z macierzą główną (wiersze usunięte są pomijane).
+        Wynik jest w pamięci - zapisuje go dopiero save().
+        """
+        if not self.delta_names:
+            return
+
+        live = [i for i in range(len(self.document_names)) if i not in self.tombstones]
+        self.matrix = vstack([self.matrix[live], self.delta]).tocsr()
+        self.document_names = self.live_names()
+
+        self.delta = csr_matrix((0, len(self.terms)), dtype=np.float32)
+        self.delta_names = []
+        self.tombstones = set()
+        self._rows = None
+        self._delta_rows = {}
+
+    def live_names(self) -> list[str]:
+        """
+        Nazwy dokumentów w kolejności wyników similarities():
+        aktualne wiersze macierzy głównej, potem delta.
+        """
+        if not self.tombstones:
+            return [*self.document_names, *self.delta_names]
+
+        return [
+            name for i, name in enumerate(self.document_names)
+            if i not in self.tombstones
+        ] + self.delta_names
+
+    def rows(self, names: list[str]) -> csr_matrix:
+        """
+        Aktualne wiersze TF-IDF podanych dokumentów (z macierzy głównej lub delty),
+        w kolejności names.
+        """
+        base_rows = self._base_rows()
+        base, delta, positions = [], [], []
+
+        for pos, name in enumerate(names):
+            if name not in self._delta_rows:
+                base.append(base_rows[name])
+                positions.append(pos)
+        for pos, name in enumerate(names):
+            if name in self._delta_rows:
+                delta.append(self._delta_rows[name])
+                positions.append(pos)
+
+        stacked = vstack([self.matrix[base], self.delta[delta]]).tocsr()
+        return stacked[np.argsort(positions)]
+
+    def similarities(self, query_vector: csr_matrix) -> np.ndarray:
+        """
+        Podobieństwo cosinusowe zapytania do wszystkich dokumentów (kolejność live_names()).
+        Wiersze macierzy i zapytanie są znormalizowane L2, więc wystarczy iloczyn skalarny.
+        """
+        sims = np.asarray((self.matrix @ query_vector.T).todense()).ravel()
+
+        if self.tombstones:
+            sims = np.delete(sims, sorted(self.tombstones))
+        if self.delta_names:
+            sims = np.concatenate([sims, np.asarray((self.delta @ query_vector.T).todense()).ravel()])
+
+        return sims
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._delta_rows or name in self._base_rows()
+
+    def _base_rows(self) -> dict[str, int]:
+        if self._rows is None:
+            self._rows = {name: i for i, name in enumerate(self.document_names)}
+        return self._rows
+
+    def _vectorize_counts(self, counts: Counter) -> dict[int, float]:
+        if not counts or len(self.terms) == 0:
+            return {}
+
+        row = {}
+        for token, tf in counts.items():
+            pos = self.terms.find(token)
+            if pos is not None:
+                if self.params["sublinear_tf"]:
+                    tf = 1.0 + np.log(tf)
+                row[int(pos)] = float(tf * self.idf[pos])
+
+        if row:
+            norm = np.sqrt(sum(v * v for v in row.values()))
+            row = {col: v / norm for col, v in row.items()}
+
+        return row
+
+
+class TermArray:
+    """
+    Posortowany słownik w postaci jednego bufora bajtów UTF-8 (uint8)
+    i tablicy granic (int32/int64, n + 1). Obie tablice można mapować przez mmap.
+
+    Kolejność bajtów UTF-8 jest zgodna z kolejnością kodów znaków,
+    więc sortowanie sklearn (po str) pozwala szukać binarnie po bajtach.
+    """
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_terms(cls, terms) -> "TermArray":
+        encoded = [t.encode("utf-8") for t in terms]
+
+        total = sum(len(t) for t in encoded)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int32 if total < 2 ** 31 else np.int64)
+        np.cumsum([len(t) for t in encoded], out=offsets[1:])
+
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(buffer, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def find(self, term: str) -> int | None:
+        """
+        Numer kolumny termu albo None, jeśli termu nie ma w słowniku.
+        """
+        key = term.encode("utf-8")
+        pos = bisect.bisect_left(self, key)
+        if pos < len(self) and self[pos] == key:
+            return pos
+        return None
@@ -0,0 +1,271 @@
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from service.document_service import DocumentService
+
+
+# korpus i zapytania procesu roboczego (ustawiane raz przez _init_worker)
+_WORKER_STATE = {}
+
+
+class TuningService:
+    """
+    Strojenie hiperparametrów (Grid Search) TF-IDF i Doc2Vec.
+
+    - korpus jest brany z DocumentService (już po preprocessingu)
+      i przekazywany do procesów roboczych raz, przy ich starcie
+    - każda konfiguracja trenowana jest w osobnym procesie
+    - ocena jest wsadowa: wszystkie zapytania ze złotego zbioru naraz
+    - wyniki dopisywane są do pliku checkpointu (z odciskiem korpusu
+      i złotego zbioru), więc przerwany przebieg można wznowić
+    """
+
+    CHECKPOINT_PATH = "data/tuning_checkpoint.jsonl"
+    BEST_PARAMS_PATH = "data/best_params.json"
+    RECALL_AT = (1, 5, 10)
+
+    GOLDEN_SET = {
+        "Violence on board during US flight": "kaggle_1.txt",
+        "Statistics regarding new virus vaccination fall campaign": "kaggle_0.txt",
+        "Supreme Court spouse talks to Capitol riot investigators": "kaggle_14.txt",
+        "Rapper gives financial support to Bronx education institution": "kaggle_50.txt",
+        "Lawyers argue for life imprisonment for mass murderer": "kaggle_188.txt",
+        "New anchor takes over prime time slot on cable news": "kaggle_450.txt",
+        "Movie director discusses complex adult film industry character": "kaggle_667.txt",
+        "Fatal accident involving college sports team students": "kaggle_999.txt"
+    }
+
+    PARAM_GRIDS = {
+        "tfidf": {
+            "ngram_range": [(1, 1), (1, 2), (2, 2)],
+            "min_df": [1, 2, 3, 5],
+            "max_df": [0.8, 0.9],
+            "sublinear_tf": [True, False],
+            "norm": ["l2"],
+        },
+        "doc2vec": {
+            "vector_size": [200, 300],
+            "window": [5, 10],
+            "min_count": [1, 2],
+            "epochs": [100, 200],
+            "dm": [0, 1],
+            "alpha": [0.025, 0.05],
+            "dbow_words": [1],
+        },
+    }
+
+    def __init__(self, documents, golden_set: dict | None = None,
+                 workers: int | None = None, checkpoint_path: str = CHECKPOINT_PATH):
+        self.documents = documents
+        self.golden_set = golden_set or self.GOLDEN_SET
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint_path = checkpoint_path
+
+        self.fingerprint = self._fingerprint()
+
+    # =========================
+    # Publiczne API serwisu
+    # =========================
+
+    def run(self, engine: str, param_grid: dict | None = None, resume: bool = True) -> list[dict]:
+        """
+        Przeprowadza Grid Search dla silnika ("tfidf" / "doc2vec")
+        i zwraca wyniki posortowane od najlepszego.
+        """
+        if engine not in self.PARAM_GRIDS:
+            raise ValueError(f"Nieznany silnik: {engine}")
+
+        param_grid = param_grid or self.PARAM_GRIDS[engine]
+        configs = [
+            _normalize_params(dict(zip(param_grid.keys(), values)))
+            for values in itertools.product(*param_grid.values())
+        ]
+
+        done = self._load_checkpoint(engine) if resume else {}
+        results = [done[key] for key in map(_params_key, configs) if key in done]
+        pending = [params for params in configs if _params_key(params) not in done]
+
+        print(f"{engine}: {len(configs)} konfiguracji, {len(results)} z checkpointu, "
+              f"{len(pending)} do policzenia ({self.workers} procesów).")
+
+        if pending:
+            queries, expected = self._prepare_queries()
+
+            os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.documents.names, self._contents(), queries, expected)
+            ) as executor, open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+                futures = [executor.submit(_run_experiment, engine, params) for params in pending]
+
+                for i, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    results.append(result)
+
+                    checkpoint.write(json.dumps({**result, "fingerprint": self.fingerprint}) + "\n")
+                    checkpoint.flush()
+
+                    print(f"[{i}/{len(pending)}] {result['params']} "
+                          f"mean_rank={result['mean_rank']}")
+
+        return sorted(results, key=self._sort_key)
+
+    def save_best(self, results_by_engine: dict, path: str = BEST_PARAMS_PATH) -> dict:
+        """
+        Zapisuje najlepsze parametry każdego silnika do pliku czytanego przez ModelService.
+        Istniejące wpisy innych silników są zachowywane.
+        """
+        best = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                best = json.load(f)
+
+        for engine, results in results_by_engine.items():
+            if results:
+                best[engine] = min(results, key=self._sort_key)["params"]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(best, f, indent=2)
+
+        return best
+
+    # =========================
+    # Metody pomocnicze (private)
+    # =========================
+
+    def _contents(self) -> list[str]:
+        return [self.documents.content(i) for i in range(len(self.documents))]
+
+    def _prepare_queries(self) -> tuple[list[str], list[int]]:
+        """
+        Preprocessing zapytań raz, w procesie głównym.
+        Oczekiwany dokument = indeks w korpusie (-1, jeśli go brak).
+        """
+        queries, expected = [], []
+        for query, doc_name in self.golden_set.items():
+            doc_id = self.documents.id_of(doc_name)
+            queries.append(DocumentService.preprocess_text(query))
+            expected.append(-1 if doc_id is None else doc_id)
+        return queries, expected
+
+    def _load_checkpoint(self, engine: str) -> dict:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+
+        done = {}
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                result = json.loads(line)
+                # wyniki dla innego korpusu lub złotego zbioru nie są porównywalne
+                if result.pop("fingerprint", None) != self.fingerprint:
+                    continue
+                if result["engine"] == engine:
+                    done[_params_key(result["params"])] = result
+        return done
+
+    def _fingerprint(self) -> str:
+        h = hashlib.sha1()
+        h.update(self.documents.fingerprint.encode("utf-8"))
+        h.update(json.dumps(self.golden_set, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _sort_key(result: dict):
+        mean_rank = result["mean_rank"] if result["mean_rank"] is not None else float("inf")
+        return mean_rank, -(result["mean_score"] or 0.0)
+
+
+# =========================
+# Proces roboczy
+# =========================
+
+def _normalize_params(params: dict) -> dict:
+    # JSON nie ma krotek - ngram_range trzymamy jako listę
+    return json.loads(json.dumps(params))
+
+
+def _params_key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def _init_worker(names, contents, queries, expected):
+    _WORKER_STATE.update(
+        names=names,
+        contents=contents,
+        queries=queries,
+        expected=np.asarray(expected)
+    )
+
+
+def _run_experiment(engine: str, params: dict) -> dict:
+    if engine == "tfidf":
+        sims = _tfidf_similarities(params)
+    else:
+        sims = _doc2vec_similarities(params)
+
+    return {"engine": engine, "params": params, **_evaluate(sims, _WORKER_STATE["expected"])}
+
+
+def _tfidf_similarities(params: dict) -> np.ndarray:
+    vectorizer_params = dict(params)
+    vectorizer_params["ngram_range"] = tuple(vectorizer_params["ngram_range"])
+
+    vectorizer = TfidfVectorizer(lowercase=False, **vectorizer_params)
+    matrix = vectorizer.fit_transform(_WORKER_STATE["contents"])
+
+    # wszystkie zapytania jedną macierzą
+    query_matrix = vectorizer.transform(_WORKER_STATE["queries"])
+    return cosine_similarity(query_matrix, matrix)
+
+
+def _doc2vec_similarities(params: dict) -> np.ndarray:
+    names = _WORKER_STATE["names"]
+    tagged_docs = [
+        TaggedDocument(content.split(), [name])
+        for name, content in zip(names, _WORKER_STATE["contents"])
+    ]
+
+    # równoległość jest na poziomie konfiguracji - jeden wątek na model
+    model = Doc2Vec(tagged_docs, **{"workers": 1, "seed": 42, **params})
+
+    query_vectors = np.asarray([
+        model.infer_vector(query.split(), epochs=100)
+        for query in _WORKER_STATE["queries"]
+    ])
+    doc_vectors = np.asarray([model.dv[name] for name in names])
+
+    return cosine_similarity(query_vectors, doc_vectors)
+
+
+def _evaluate(sims: np.ndarray, expected: np.ndarray) -> dict:
+    """
+    Ranga oczekiwanego dokumentu = 1 + liczba dokumentów z wyższym podobieństwem.
+    """
+    found = expected >= 0
+    rows = np.arange(len(expected))[found]
+    expected_scores = sims[rows, expected[found]]
+    ranks = 1 + (sims[rows] > expected_scores[:, None]).sum(axis=1)
+
+    metrics = {
+        "mean_rank": round(float(ranks.mean()), 4) if len(ranks) else None,
+        "mean_score": round(float(expected_scores.mean()), 4) if len(ranks) else None,
+    }
+    for k in TuningService.RECALL_AT:
+        # zapytania bez oczekiwanego dokumentu w korpusie liczą się jako chybienie
+        metrics[f"recall@{k}"] = round(float((ranks <= k).sum() / len(expected)), 4) if len(expected) else 0.0
+
+    return metrics
@@ -0,0 +1,70 @@
+import os
+import time
+import uuid
+import shutil
+
+
+class VersionedDir:
+    """
+    Katalog z wersjami danych: root/<wersja>/ + plik root/CURRENT
+    wskazujący aktualną wersję.
+
+    Nowa wersja jest zapisywana obok starej i publikowana przez atomową
+    podmianę pliku CURRENT, więc katalog zmapowany (mmap) przez ten lub
+    inny proces nigdy nie jest usuwany w trakcie zapisu. Po publikacji
+    zostaje KEEP_PREVIOUS poprzednich wersji (mogą ich jeszcze używać inne
+    instancje, np. inne sesje Streamlit) - starsze są usuwane. Czytelnicy,
+    którym wersja zniknęła, powinni ponownie odczytać CURRENT.
+    Jeśli system nie pozwala usunąć wersji (Windows - otwarte mapowania),
+    zostanie usunięta przy kolejnej publikacji.
+    """
+
+    CURRENT_FILE = "CURRENT"
+    KEEP_PREVIOUS = 2
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def current(self) -> str | None:
+        """
+        Ścieżka aktualnej wersji albo None, jeśli nic nie opublikowano.
+        """
+        current_path = os.path.join(self.root, self.CURRENT_FILE)
+        if not os.path.exists(current_path):
+            return None
+
+        with open(current_path, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+
+        path = os.path.join(self.root, version)
+        return path if os.path.isdir(path) else None
+
+    def new_version(self) -> str:
+        """
+        Tworzy pusty katalog nowej (jeszcze nieopublikowanej) wersji.
+        Nazwa zaczyna się od czasu utworzenia, więc sortuje się chronologicznie.
+        """
+        path = os.path.join(self.root, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(path)
+        return path
+
+    def publish(self, version_path: str) -> None:
+        version = os.path.basename(version_path)
+
+        tmp_path = os.path.join(self.root, self.CURRENT_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, self.CURRENT_FILE))
+
+        self._cleanup(keep=version)
+
+    def _cleanup(self, keep: str) -> None:
+        previous = sorted(
+            (entry for entry in os.listdir(self.root)
+             if entry != keep and os.path.isdir(os.path.join(self.root, entry))),
+            # wersje bez znacznika czasu (starszy format nazw) są najstarsze
+            key=lambda entry: entry if "-" in entry else ""
+        )
+
+        for entry in previous[:max(len(previous) - self.KEEP_PREVIOUS, 0)]:
+            shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
@@ -0,0 +1,90 @@
+import argparse
+import json
+
+from service.document_service import DocumentService
+from service.tuning_service import TuningService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Strojenie hiperparametrów TF-IDF i Doc2Vec (Grid Search)."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["tfidf", "doc2vec", "all"],
+        default="all",
+        help="silnik do strojenia"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="liczba procesów (domyślnie liczba rdzeni)"
+    )
+    parser.add_argument(
+        "--golden-set",
+        default=None,
+        help="plik JSON {zapytanie: nazwa_dokumentu} (domyślnie zbiór wbudowany)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=TuningService.CHECKPOINT_PATH,
+        help="plik z wynikami cząstkowymi (wznawianie)"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="ignoruj istniejący checkpoint i licz wszystko od nowa"
+    )
+    parser.add_argument(
+        "--output",
+        default=TuningService.BEST_PARAMS_PATH,
+        help="plik z najlepszymi parametrami dla ModelService"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="ile najlepszych konfiguracji wypisać"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    golden_set = None
+    if args.golden_set:
+        with open(args.golden_set, "r", encoding="utf-8") as f:
+            golden_set = json.load(f)
+
+    doc_service = DocumentService()
+    # korpus z cache; bez zapisu statusu - strojenie nie może ukryć zmian
+    # w dokumentach przed aplikacją i main.py
+    documents = doc_service.load_documents(save_status=False)
+    print(f"Łącznie dokumentów: {len(documents)}")
+
+    tuning = TuningService(
+        documents,
+        golden_set=golden_set,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint
+    )
+
+    engines = ["tfidf", "doc2vec"] if args.engine == "all" else [args.engine]
+
+    results = {}
+    for engine in engines:
+        results[engine] = tuning.run(engine, resume=not args.no_resume)
+
+        print(f"\nNajlepsze parametry ({engine}):")
+        for result in results[engine][:args.top]:
+            metrics = {k: v for k, v in result.items() if k not in ("engine", "params")}
+            print(f"{result['params']} | {metrics}")
+
+    best = tuning.save_best(results, args.output)
+    print(f"\nZapisano najlepsze parametry do {args.output}: {best}")
+
+
+if __name__ == "__main__":
+    main()